@@ -1,3 +1,134 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+from django.utils.functional import cached_property
 
-# Register your models here.
+from . import counting, deletion, sharding
+from .models import Person, Pet
+
+INLINE_PET_LIMIT = 50
+
+SHARDED_WARNING = (
+    "Person and Pet data is split across API_SHARDS. The admin only reads "
+    "the default database, so rows on other shards are missing here and "
+    "editing is disabled."
+)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts unfiltered changelists with api.counting instead of running
+    COUNT(*) over the whole table.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            return counting.count_rows(queryset.model, queryset.db)
+
+        return super().count
+
+
+class PetInlineFormSet(BaseInlineFormSet):
+    def get_queryset(self):
+        # Forms index into get_queryset() one at a time; keep a single
+        # sliced queryset so its result cache is shared by every form.
+        if not hasattr(self, '_sliced_queryset'):
+            self._sliced_queryset = \
+                super().get_queryset()[:INLINE_PET_LIMIT]
+
+        return self._sliced_queryset
+
+
+class PetInline(admin.TabularInline):
+    model = Pet
+    formset = PetInlineFormSet
+    fields = ('name', 'age')
+    ordering = ('-id',)
+    extra = 1
+    show_change_link = True
+    verbose_name_plural = f"pets (latest {INLINE_PET_LIMIT})"
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings shared by Person and Pet: newest rows first on the
+    primary key, no second COUNT(*) for filtered results, and estimated
+    totals.
+
+    The admin does not route through api.sharding, so with more than one
+    shard it becomes read-only and says so on every page.
+    """
+    ordering = ('-id',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def warn_if_sharded(self, request):
+        if sharding.is_sharded():
+            messages.warning(request, SHARDED_WARNING)
+
+    def changelist_view(self, request, extra_context=None):
+        self.warn_if_sharded(request)
+        return super().changelist_view(request, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url='',
+                        extra_context=None):
+        self.warn_if_sharded(request)
+        return super().changeform_view(request, object_id, form_url,
+                                       extra_context)
+
+    def has_add_permission(self, request):
+        return not sharding.is_sharded() and \
+            super().has_add_permission(request)
+
+    def has_change_permission(self, request, obj=None):
+        return not sharding.is_sharded() and \
+            super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return not sharding.is_sharded() and \
+            super().has_delete_permission(request, obj)
+
+
+@admin.register(Person)
+class PersonAdmin(ScalableAdmin):
+    list_display = ('id', 'first_name', 'last_name', 'age')
+    search_fields = ('^first_name', '^last_name')
+    inlines = [PetInline]
+
+    def get_deleted_objects(self, objs, request):
+        # The stock confirmation page lists every cascaded pet; summarize
+        # them instead.
+        objs = list(objs)
+        pet_count = Pet.objects.filter(owner__in=objs).count()
+        perms_needed = set()
+        if pet_count and not request.user.has_perm('api.delete_pet'):
+            perms_needed.add(Pet._meta.verbose_name)
+
+        model_count = {
+            Person._meta.verbose_name_plural: len(objs),
+            Pet._meta.verbose_name_plural: pet_count,
+        }
+
+        return [str(obj) for obj in objs], model_count, perms_needed, []
+
+    def delete_model(self, request, obj):
+        deletion.delete_person(obj.pk)
+
+    def delete_queryset(self, request, queryset):
+        deletion.delete_people(list(queryset.values_list('id', flat=True)))
+
+
+@admin.register(Pet)
+class PetAdmin(ScalableAdmin):
+    list_display = ('id', 'name', 'age', 'owner')
+    list_select_related = ('owner',)
+    search_fields = ('^name',)
+    autocomplete_fields = ('owner',)
+
+    def delete_model(self, request, obj):
+        deletion.delete_pet(obj.pk)
+
+    def delete_queryset(self, request, queryset):
+        deletion.delete_pets(list(queryset.values_list('id', flat=True)))
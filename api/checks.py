@@ -0,0 +1,17 @@
+from django.core.checks import Warning, register
+
+from . import sharding
+
+
+@register()
+def check_admin_sharding(app_configs, **kwargs):
+    if not sharding.is_sharded():
+        return []
+
+    return [Warning(
+        "The Person and Pet admin is read-only and only shows the default "
+        "database when API_SHARDS lists more than one shard.",
+        hint="Use the API or the rebalance_shards command to manage "
+             "sharded data.",
+        id='api.W001',
+    )]
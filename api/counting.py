@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+from . import sharding
+
+
+def _mysql_estimate(cursor, table):
+    # information_schema.TABLES.TABLE_ROWS is cached for
+    # information_schema_stats_expiry seconds, a day by default on MySQL 8.
+    # InnoDB's persistent statistics are refreshed once about 10% of the
+    # table has changed, so read those when the user may.
+    try:
+        cursor.execute(
+            "SELECT n_rows FROM mysql.innodb_table_stats "
+            "WHERE database_name = DATABASE() AND table_name = %s", [table])
+        row = cursor.fetchone()
+        if row is not None:
+            return row
+    except DatabaseError:
+        pass
+
+    try:
+        cursor.execute("SET SESSION information_schema_stats_expiry = 0")
+    except DatabaseError:
+        pass  # Before MySQL 8, TABLE_ROWS is not cached.
+    cursor.execute(
+        "SELECT TABLE_ROWS FROM information_schema.TABLES "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", [table])
+
+    return cursor.fetchone()
+
+
+def estimate_count(model, using):
+    """
+    Returns the database's row estimate for model's table on using, or None
+    when the backend keeps no statistics (e.g. SQLite before ANALYZE).
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                row = _mysql_estimate(cursor, table)
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT reltuples::bigint FROM pg_class "
+                    "WHERE relname = %s", [table])
+                row = cursor.fetchone()
+            elif connection.vendor == 'sqlite':
+                cursor.execute(
+                    "SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1",
+                    [table])
+                row = cursor.fetchone()
+            else:
+                return None
+    except DatabaseError:
+        return None
+
+    if row is None or row[0] is None:
+        return None
+
+    estimate = int(str(row[0]).split()[0])
+
+    return estimate if estimate >= 0 else None
+
+
+def _cache_key(model, using):
+    return f"api:count:{using}:{model._meta.db_table}"
+
+
+def count_rows(model, using, exact=False):
+    """
+    Counts model's rows on using. Small tables are counted exactly, very
+    large ones return the statistics estimate, and the range in between
+    serves an exact count cached for API_COUNT_CACHE_TTL seconds.
+    """
+    queryset = model.objects.using(using)
+    if exact:
+        return queryset.count()
+
+    estimate = estimate_count(model, using)
+    exact_below = getattr(settings, 'API_EXACT_COUNT_THRESHOLD', 10000)
+    if estimate is None or estimate < exact_below:
+        return queryset.count()
+
+    estimate_above = getattr(settings, 'API_ESTIMATED_COUNT_THRESHOLD',
+                             1000000)
+    if estimate >= estimate_above:
+        return estimate
+
+    key = _cache_key(model, using)
+    count = cache.get(key)
+    if count is None:
+        count = queryset.count()
+        cache.set(key, count, getattr(settings, 'API_COUNT_CACHE_TTL', 30))
+
+    return count
+
+
+def total_count(model, exact=False):
+    return sum(sharding.scatter(
+        lambda alias: count_rows(model, alias, exact=exact)))
+
+
+def invalidate(model, using):
+    cache.delete(_cache_key(model, using))
@@ -0,0 +1,110 @@
+from django.db import transaction
+
+from . import counting, search, sharding
+from .models import Person, Pet, PetKey, SearchToken
+
+BATCH_SIZE = 1000
+
+
+def _delete_rows(alias, person_ids):
+    """
+    Deletes the given people and all of their pets on one shard and returns
+    (people, pet_ids).
+    """
+    with transaction.atomic(using=alias):
+        pets = Pet.objects.using(alias).filter(owner_id__in=person_ids)
+        pet_ids = list(pets.values_list('id', flat=True))
+
+        # _raw_delete issues one DELETE per table instead of running the
+        # collector, which would load every row and send per-object signals.
+        pets._raw_delete(alias)
+        person_count = Person.objects.using(alias) \
+            .filter(id__in=person_ids)._raw_delete(alias)
+
+    counting.invalidate(Person, alias)
+    counting.invalidate(Pet, alias)
+
+    return person_count, pet_ids
+
+
+def _forget_owners(person_ids, pet_ids):
+    with transaction.atomic(using=sharding.catalog_alias()):
+        PetKey.objects.filter(owner_id__in=person_ids).delete()
+        search.unindex(SearchToken.PERSON, person_ids)
+        search.unindex(SearchToken.PET, pet_ids)
+
+
+def _delete_owners(alias, person_ids):
+    with transaction.atomic(using=sharding.catalog_alias()):
+        person_count, pet_ids = _delete_rows(alias, person_ids)
+        _forget_owners(person_ids, pet_ids)
+
+    return person_count, len(pet_ids)
+
+
+def delete_people(person_ids):
+    people = pets = 0
+    for alias, ids in sharding.group_people(person_ids).items():
+        deleted_people, deleted_pets = _delete_owners(alias, ids)
+        people += deleted_people
+        pets += deleted_pets
+
+    return {"people": people, "pets": pets}
+
+
+def delete_person(person_id):
+    return delete_people([person_id])
+
+
+def delete_pets(pet_ids):
+    count = 0
+    catalog = sharding.catalog_alias()
+    for alias, ids in sharding.group_pets(pet_ids).items():
+        with transaction.atomic(using=alias), \
+                transaction.atomic(using=catalog):
+            count += Pet.objects.using(alias).filter(pk__in=ids) \
+                ._raw_delete(alias)
+            PetKey.objects.filter(pk__in=ids).delete()
+            search.unindex(SearchToken.PET, ids)
+        counting.invalidate(Pet, alias)
+
+    return {"pets": count}
+
+
+def delete_pet(pet_id):
+    return delete_pets([pet_id])
+
+
+def delete_people_matching(**filters):
+    """
+    Deletes every person matching filters, and their pets, in batches of
+    BATCH_SIZE owners per transaction on each shard in parallel. Catalog
+    and search rows are cleaned up afterwards from the calling thread, so
+    shards never contend for catalog writes.
+    """
+
+    def purge(alias):
+        batches = []
+        after = 0
+        while True:
+            # Keyset paging resumes after the last match instead of
+            # rescanning rows that did not match.
+            person_ids = list(Person.objects.using(alias)
+                              .filter(id__gt=after, **filters)
+                              .order_by('id')
+                              .values_list('id', flat=True)[:BATCH_SIZE])
+            if not person_ids:
+                return batches
+            after = person_ids[-1]
+
+            person_count, pet_ids = _delete_rows(alias, person_ids)
+            batches.append((person_ids, pet_ids, person_count))
+
+    people = pets = 0
+    for batches in sharding.scatter(purge):
+        for person_ids, pet_ids, person_count in batches:
+            _forget_owners(person_ids, pet_ids)
+            people += person_count
+            pets += len(pet_ids)
+
+    return {"people": people, "pets": pets}
@@ -0,0 +1,159 @@
+from functools import wraps
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+from .singleflight import SingleFlight
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+
+class InFlight(Exception):
+    """
+    Raised when another request with the same key is still running after
+    the wait timeout.
+    """
+
+
+class _Entry:
+    def __init__(self, fingerprint, status, content, content_type):
+        self.fingerprint = fingerprint
+        self.status = status
+        self.content = content
+        self.content_type = content_type
+
+    def replay(self):
+        response = HttpResponse(self.content, status=self.status,
+                                content_type=self.content_type)
+        response['Idempotent-Replayed'] = 'true'
+
+        return response
+
+
+class IdempotencyStore:
+    """
+    Remembers the response to the first request made with each idempotency
+    key in a Django cache, so every worker sharing that cache replays it.
+    Entries expire after ttl seconds and the cache backend bounds their
+    number; lookups are single cache gets.
+
+    While the first request runs, a cache.add() marker makes duplicates in
+    other workers poll for its response instead of running the view again.
+    Duplicates in the same process wait on a SingleFlight instead.
+    """
+
+    def __init__(self, cache_alias='default', ttl=86400, lock_timeout=30):
+        self.cache_alias = cache_alias
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self._flight = SingleFlight(negative_ttl=0)
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _cache_keys(self, key):
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        return (f"api:idempotency:{digest}",
+                f"api:idempotency:{digest}:lock")
+
+    def get(self, key):
+        return self.cache.get(self._cache_keys(key)[0])
+
+    def _execute(self, key, fingerprint, call, fresh):
+        entry_key, lock_key = self._cache_keys(key)
+        deadline = time.monotonic() + self.lock_timeout
+
+        while True:
+            entry = self.cache.get(entry_key)
+            if entry is not None:
+                return entry
+
+            if self.cache.add(lock_key, True, self.lock_timeout):
+                try:
+                    # The first request may have finished between the get
+                    # and the add.
+                    entry = self.cache.get(entry_key)
+                    if entry is not None:
+                        return entry
+
+                    response = call()
+                    fresh['response'] = response
+                    if response.streaming or response.status_code >= 500:
+                        return None
+
+                    entry = _Entry(fingerprint, response.status_code,
+                                   response.content,
+                                   response['Content-Type'])
+                    self.cache.set(entry_key, entry, self.ttl)
+
+                    return entry
+                finally:
+                    self.cache.delete(lock_key)
+
+            if time.monotonic() >= deadline:
+                raise InFlight(key)
+            time.sleep(POLL_INTERVAL)
+
+    def run(self, key, fingerprint, call):
+        """
+        Returns call()'s response for a new key, or a replay of the stored
+        one. Returns None if the key was already used for another request.
+        """
+        fresh = {}
+        entry = self._flight.do(
+            key, lambda: self._execute(key, fingerprint, call, fresh))
+        if 'response' in fresh:
+            return fresh['response']
+        if entry is None:
+            # The first request could not be stored, so run this one too.
+            return call()
+        if entry.fingerprint != fingerprint:
+            return None
+
+        return entry.replay()
+
+
+store = IdempotencyStore(
+    cache_alias=getattr(settings, 'API_IDEMPOTENCY_CACHE', 'default'),
+    ttl=getattr(settings, 'API_IDEMPOTENCY_TTL', 86400),
+    lock_timeout=getattr(settings, 'API_IDEMPOTENCY_LOCK_TIMEOUT', 30))
+
+
+def idempotent(view):
+    """
+    Makes POST requests carrying an Idempotency-Key header safe to retry.
+    """
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if request.method != 'POST' or key is None:
+            return view(request, *args, **kwargs)
+
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return JsonResponse({"error": f"{IDEMPOTENCY_HEADER} must be 1 "
+                                          f"to {MAX_KEY_LENGTH} characters"},
+                                status=400)
+
+        fingerprint = hashlib.sha256(request.body).hexdigest()
+        try:
+            response = store.run((request.path, key), fingerprint,
+                                 lambda: view(request, *args, **kwargs))
+        except InFlight:
+            return JsonResponse({"error": f"A request with this "
+                                          f"{IDEMPOTENCY_HEADER} is still "
+                                          f"in progress"}, status=409)
+        if response is None:
+            return JsonResponse({"error": f"{IDEMPOTENCY_HEADER} was already "
+                                          f"used with a different body"},
+                                status=422)
+
+        return response
+
+    return wrapper
@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api import sharding
+from api.models import Person, Pet, ShardBucket
+
+
+class Command(BaseCommand):
+    help = (
+        "Moves owners (and their pets) onto the shard their id now maps to. "
+        "With --bucket and --to, pins that hash bucket to a shard once its "
+        "owners have been copied there. Pause writes while this runs; other "
+        "processes pick up a new bucket map within a few seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bucket', type=int)
+        parser.add_argument('--to', dest='alias')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        aliases = sharding.shard_aliases()
+        bucket, alias = options['bucket'], options['alias']
+        dry_run = options['dry_run']
+
+        if (bucket is None) != (alias is None):
+            raise CommandError("--bucket and --to must be given together.")
+
+        pinned = {}
+        if bucket is not None:
+            if not 0 <= bucket < sharding.BUCKET_COUNT:
+                raise CommandError(f"Bucket must be in "
+                                   f"[0, {sharding.BUCKET_COUNT}).")
+            if alias not in aliases:
+                raise CommandError(f"'{alias}' is not one of API_SHARDS.")
+            pinned[bucket] = alias
+
+        moved_people = moved_pets = 0
+        copied = []
+        for source in aliases:
+            batches = self._misplaced(source, options['batch_size'], pinned)
+            for target, person_ids in batches:
+                if dry_run:
+                    moved_people += len(person_ids)
+                    moved_pets += Pet.objects.using(source) \
+                        .filter(owner_id__in=person_ids).count()
+                    continue
+
+                people, pets = sharding.copy_owners(source, target,
+                                                    person_ids)
+                copied.append((source, person_ids))
+                moved_people += people
+                moved_pets += pets
+
+        if not dry_run:
+            # Only route the bucket to its new shard once every owner is
+            # there, and only drop the source rows after that.
+            if pinned:
+                ShardBucket.objects.using(sharding.catalog_alias()) \
+                    .update_or_create(bucket=bucket,
+                                      defaults={'alias': alias})
+                sharding.bucket_map.invalidate()
+
+            for source, person_ids in copied:
+                sharding.drop_owners(source, person_ids)
+
+        verb = "Would move" if dry_run else "Moved"
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {moved_people} people and {moved_pets} pets."))
+
+    def _misplaced(self, source, batch_size, pinned):
+        """
+        Yields (target, person_ids) batches for people on source that belong
+        elsewhere once pinned is applied.
+        """
+        after = 0
+        while True:
+            ids = list(Person.objects.using(source).filter(id__gt=after)
+                       .order_by('id')
+                       .values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return
+            after = ids[-1]
+
+            groups = sharding.group_people(ids, pinned)
+            for target, person_ids in groups.items():
+                if target != source:
+                    yield target, person_ids
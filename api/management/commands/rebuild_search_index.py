@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import search, sharding
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the name search index from the Person and Pet tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with transaction.atomic(using=sharding.catalog_alias()):
+            search.rebuild(batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS("Search index rebuilt."))
@@ -0,0 +1,94 @@
+import re
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_sequence, compress_string
+
+from .negotiation import (JSON_CONTENT_TYPE, MSGPACK_CONTENT_TYPES,
+                          parse_header_values)
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+def brotli_sequence(sequence):
+    compressor = brotli.Compressor()
+    for item in sequence:
+        # process() buffers until flush(), which would hold the whole
+        # stream back until it ends.
+        chunk = compressor.process(item) + compressor.flush()
+        if chunk:
+            yield chunk
+    yield compressor.finish()
+
+
+# Only API payloads are compressed. HTML pages such as the admin carry CSRF
+# tokens next to reflected input, which compression exposes to BREACH.
+COMPRESSIBLE_CONTENT_TYPES = {JSON_CONTENT_TYPE, *MSGPACK_CONTENT_TYPES}
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compresses JSON and MessagePack responses with brotli or gzip based on
+    Accept-Encoding.
+    Buffered responses below API_COMPRESSION_MIN_SIZE bytes are left alone;
+    streaming responses are always compressed chunk by chunk.
+    """
+
+    def choose_encoding(self, request):
+        accepted = parse_header_values(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+        ranked = sorted(candidates,
+                        key=lambda e: accepted.get(e, accepted.get('*', 0.0)),
+                        reverse=True)
+        best = ranked[0]
+        if accepted.get(best, accepted.get('*', 0.0)) <= 0:
+            return None
+
+        return best
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '').split(';')[0]
+        if content_type.strip().lower() not in COMPRESSIBLE_CONTENT_TYPES:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        if response.has_header('Content-Encoding'):
+            return response
+        min_size = getattr(settings, 'API_COMPRESSION_MIN_SIZE', 1024)
+        if not response.streaming and len(response.content) < min_size:
+            return response
+
+        encoding = self.choose_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if encoding == 'br':
+                response.streaming_content = \
+                    brotli_sequence(response.streaming_content)
+            else:
+                response.streaming_content = \
+                    compress_sequence(response.streaming_content)
+            del response['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed = brotli.compress(response.content)
+            else:
+                compressed = compress_string(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(response.content))
+
+        # The representation changed, so a strong ETag no longer applies.
+        if response.has_header('ETag'):
+            response['ETag'] = re.sub(r'^"', 'W/"', response['ETag'])
+        response['Content-Encoding'] = encoding
+
+        return response
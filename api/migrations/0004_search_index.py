@@ -0,0 +1,46 @@
+# Generated by Django 3.2.3 on 2026-10-19 14:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_rename_owner_id_pet_owner'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=32, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('person', 'Person'), ('pet', 'Pet')], max_length=8)),
+                ('object_id', models.BigIntegerField()),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.searchterm')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SearchGram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('gram', models.CharField(max_length=3)),
+                ('term', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.searchterm')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchtoken',
+            index=models.Index(fields=['kind', 'object_id'], name='api_searcht_kind_e91fdc_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchgram',
+            unique_together={('gram', 'term')},
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 3.2.3 on 2026-10-19 14:32
+
+from django.db import migrations, models
+
+
+def backfill_keys(apps, schema_editor):
+    connection = schema_editor.connection
+    if 'api_person' not in connection.introspection.table_names():
+        # The catalog is not also a shard, so there is nothing to copy.
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO api_personkey (id) "
+                       "SELECT id FROM api_person")
+        cursor.execute("INSERT INTO api_petkey (id, owner_id) "
+                       "SELECT id, owner_id FROM api_pet")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PetKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('owner_id', models.BigIntegerField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShardBucket',
+            fields=[
+                ('bucket', models.IntegerField(primary_key=True, serialize=False)),
+                ('alias', models.CharField(max_length=64)),
+            ],
+        ),
+        migrations.RunPython(backfill_keys, migrations.RunPython.noop,
+                             hints={'model_name': 'personkey'}),
+    ]
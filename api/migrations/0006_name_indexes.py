@@ -0,0 +1,25 @@
+# Generated by Django 3.2.3 on 2026-10-19 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_shard_catalog'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['first_name'], name='api_person_first_n_12220d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='person',
+            index=models.Index(fields=['last_name'], name='api_person_last_na_0bafc0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['name'], name='api_pet_name_8aeaab_idx'),
+        ),
+    ]
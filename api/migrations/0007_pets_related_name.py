@@ -0,0 +1,23 @@
+# Generated by Django 3.2.3 on 2026-10-19 14:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_name_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pet',
+            name='owner',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pets', to='api.person'),
+        ),
+        migrations.AddIndex(
+            model_name='pet',
+            index=models.Index(fields=['owner', 'id'], name='api_pet_owner_i_fa2f7d_idx'),
+        ),
+    ]
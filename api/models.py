@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import models, router
+from django.db.models import prefetch_related_objects
 
 
 class Person(models.Model):
@@ -6,19 +7,115 @@ class Person(models.Model):
     last_name = models.CharField(max_length=32)
     age = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['first_name']),
+            models.Index(fields=['last_name']),
+        ]
+
     def __str__(self):
         return f"{self.first_name} {self.last_name} " + \
                f"(Age: {self.age})"
 
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            # Ids come from the catalog so the shard is known before insert;
+            # the router then overrides the manager's default alias.
+            self.pk = PersonKey.allocate()
+            kwargs['force_insert'] = True
+            kwargs['using'] = router.db_for_write(Person, instance=self)
+        super().save(*args, **kwargs)
+
     def get_pets(self):
-        pets = Pet.objects.filter(owner_id=self.id)
+        # Uses pets prefetched with prefetch_related('pets'); otherwise loads
+        # them once and keeps them on this instance.
+        if 'pets' not in getattr(self, '_prefetched_objects_cache', {}):
+            prefetch_related_objects([self], 'pets')
+        pets = self.pets.all()
         return pets
 
 
 class Pet(models.Model):
     name = models.CharField(max_length=32)
     age = models.IntegerField(default=0)
-    owner = models.ForeignKey(Person, on_delete=models.CASCADE)
+    owner = models.ForeignKey(Person, on_delete=models.CASCADE,
+                              related_name='pets')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['name']),
+            models.Index(fields=['owner', 'id']),
+        ]
 
     def __str__(self):
         return f"{self.name} (Age: {self.age})"
+
+    def save(self, *args, **kwargs):
+        if self.pk is None:
+            self.pk = PetKey.allocate(self.owner_id)
+            kwargs['force_insert'] = True
+            kwargs['using'] = router.db_for_write(Pet, instance=self)
+        super().save(*args, **kwargs)
+
+
+class SearchTerm(models.Model):
+    term = models.CharField(max_length=32, unique=True)
+
+    def __str__(self):
+        return self.term
+
+
+class SearchGram(models.Model):
+    gram = models.CharField(max_length=3)
+    term = models.ForeignKey(SearchTerm, on_delete=models.CASCADE)
+
+    class Meta:
+        unique_together = ('gram', 'term')
+
+
+class SearchToken(models.Model):
+    PERSON = 'person'
+    PET = 'pet'
+    KIND_CHOICES = [
+        (PERSON, 'Person'),
+        (PET, 'Pet'),
+    ]
+
+    term = models.ForeignKey(SearchTerm, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'object_id']),
+        ]
+
+
+class PersonKey(models.Model):
+    """
+    Catalog-side id sequence for Person, so ids are unique across shards.
+    """
+
+    @classmethod
+    def allocate(cls):
+        return cls.objects.create().pk
+
+
+class PetKey(models.Model):
+    """
+    Catalog-side id sequence for Pet that also records each pet's owner, so
+    /pets/<id>/ can find the owner's shard without asking every shard.
+    """
+    owner_id = models.BigIntegerField(db_index=True)
+
+    @classmethod
+    def allocate(cls, owner_id):
+        return cls.objects.create(owner_id=owner_id).pk
+
+
+class ShardBucket(models.Model):
+    bucket = models.IntegerField(primary_key=True)
+    alias = models.CharField(max_length=64)
+
+    def __str__(self):
+        return f"{self.bucket} -> {self.alias}"
@@ -0,0 +1,79 @@
+from django.core.exceptions import BadRequest
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.parsers import JSONParser
+import io
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPE = 'application/msgpack'
+MSGPACK_CONTENT_TYPES = {MSGPACK_CONTENT_TYPE, 'application/x-msgpack'}
+
+
+def parse_header_values(header):
+    """
+    Parses an Accept-style header into {value: q}, keeping the first
+    occurrence of each value.
+    """
+    values = {}
+    for item in header.split(','):
+        value, *params = [part.strip() for part in item.split(';')]
+        if not value:
+            continue
+
+        q = 1.0
+        for param in params:
+            name, _, number = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        values.setdefault(value.lower(), q)
+
+    return values
+
+
+def wants_msgpack(request):
+    if msgpack is None:
+        return False
+
+    accepted = parse_header_values(request.META.get('HTTP_ACCEPT', ''))
+    msgpack_q = max((accepted.get(t, 0.0) for t in MSGPACK_CONTENT_TYPES))
+    json_q = max(accepted.get(JSON_CONTENT_TYPE, 0.0),
+                 accepted.get('application/*', 0.0),
+                 accepted.get('*/*', 0.0))
+
+    # JSON stays the default when both are equally acceptable.
+    return msgpack_q > json_q
+
+
+def render(request, data, status=200):
+    if wants_msgpack(request):
+        response = HttpResponse(msgpack.packb(data),
+                                content_type=MSGPACK_CONTENT_TYPE,
+                                status=status)
+    else:
+        response = JsonResponse(data, status=status)
+
+    patch_vary_headers(response, ('Accept',))
+
+    return response
+
+
+def parse_body(request):
+    content_type = request.content_type.lower()
+    if content_type in MSGPACK_CONTENT_TYPES:
+        if msgpack is None:
+            raise BadRequest("MessagePack support is not installed")
+        try:
+            return msgpack.unpackb(request.body)
+        except ValueError as e:
+            raise BadRequest(f"Malformed MessagePack body: {e}")
+
+    stream = io.BytesIO(request.body)
+    return JSONParser().parse(stream)
@@ -0,0 +1,63 @@
+from django.db import DEFAULT_DB_ALIAS
+
+from . import sharding
+
+SHARDED_MODELS = {'person', 'pet'}
+
+
+class ShardRouter:
+    """
+    Sends Person and Pet rows to the shard chosen by the owning person's id
+    and every other api model to the catalog database. Other apps stay on
+    the default database.
+    """
+
+    def _shard_for(self, instance):
+        if instance._state.db:
+            return instance._state.db
+
+        opts = instance._meta
+        if opts.app_label != 'api' or opts.model_name not in SHARDED_MODELS:
+            return None
+
+        person_id = instance.pk if opts.model_name == 'person' \
+            else instance.owner_id
+        if person_id is None:
+            return None
+
+        return sharding.shard_for_person(person_id)
+
+    def _db_for(self, model, **hints):
+        if model._meta.app_label != 'api':
+            return None
+
+        if model._meta.model_name in SHARDED_MODELS:
+            instance = hints.get('instance')
+            return self._shard_for(instance) if instance is not None else None
+
+        return sharding.catalog_alias()
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, **hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        labels = {obj1._meta.model_name, obj2._meta.model_name}
+        if labels <= SHARDED_MODELS:
+            return obj1._state.db == obj2._state.db
+
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label != 'api':
+            return db == DEFAULT_DB_ALIAS
+
+        if model_name is None:
+            return None
+
+        if model_name in SHARDED_MODELS:
+            return db in sharding.shard_aliases()
+
+        return db == sharding.catalog_alias()
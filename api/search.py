@@ -0,0 +1,227 @@
+from collections import defaultdict
+from difflib import SequenceMatcher
+import heapq
+import re
+import unicodedata
+
+from django.db.models import Count
+
+from . import sharding
+from .models import Person, Pet, SearchGram, SearchTerm, SearchToken
+
+TERM_MAX_LENGTH = 32
+MAX_QUERY_TOKENS = 4
+MAX_PREFIX_TERMS = 50
+MAX_FUZZY_CANDIDATES = 100
+MAX_POSTINGS = 1000
+FUZZY_MIN_LENGTH = 3
+FUZZY_CUTOFF = 0.7
+
+EXACT_SCORE = 1.0
+PREFIX_SCORE = 0.9
+FUZZY_SCORE = 0.8
+
+_token_re = re.compile(r'[^\W_]+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return text.lower()
+
+
+def tokenize(text):
+    tokens = (t[:TERM_MAX_LENGTH] for t in _token_re.findall(normalize(text)))
+    return list(dict.fromkeys(tokens))
+
+
+def term_grams(term):
+    padded = f"${term}$"
+    return list(dict.fromkeys(padded[i:i + 3]
+                              for i in range(len(padded) - 2)))
+
+
+def _term_ids(terms):
+    if not terms:
+        return []
+
+    ids = dict(SearchTerm.objects.filter(term__in=terms)
+               .values_list('term', 'id'))
+    missing = [t for t in terms if t not in ids]
+    if missing:
+        SearchTerm.objects.bulk_create(
+            [SearchTerm(term=t) for t in missing], ignore_conflicts=True)
+        created = dict(SearchTerm.objects.filter(term__in=missing)
+                       .values_list('term', 'id'))
+        SearchGram.objects.bulk_create(
+            [SearchGram(gram=g, term_id=created[t])
+             for t in missing for g in term_grams(t)],
+            ignore_conflicts=True)
+        ids.update(created)
+
+    return [ids[t] for t in terms]
+
+
+def index_object(kind, object_id, *texts):
+    term_ids = _term_ids(tokenize(' '.join(texts)))
+    SearchToken.objects.filter(kind=kind, object_id=object_id).delete()
+    SearchToken.objects.bulk_create(
+        [SearchToken(term_id=i, kind=kind, object_id=object_id)
+         for i in term_ids])
+
+
+def index_person(person):
+    index_object(SearchToken.PERSON, person.id,
+                 person.first_name, person.last_name)
+
+
+def index_pet(pet):
+    index_object(SearchToken.PET, pet.id, pet.name)
+
+
+def unindex(kind, object_ids):
+    SearchToken.objects.filter(kind=kind, object_id__in=object_ids).delete()
+
+
+def rebuild(batch_size=1000):
+    SearchToken.objects.all().delete()
+    for alias in sharding.shard_aliases():
+        people = Person.objects.using(alias).order_by('id')
+        for person in people.iterator(batch_size):
+            index_person(person)
+        for pet in Pet.objects.using(alias).order_by('id').iterator(batch_size):
+            index_pet(pet)
+
+
+def _matching_terms(token):
+    """
+    Returns {term_id: score} for vocabulary terms matching token, either as
+    a prefix or, for longer tokens, as a close trigram match.
+    """
+    matches = {}
+    # Terms are stored lowercased, so a prefix is a plain range on the
+    # unique term index. LIKE would scan the vocabulary on SQLite (no
+    # NOCASE collation) and, via LIKE BINARY, on MySQL.
+    prefix_terms = SearchTerm.objects \
+        .filter(term__gte=token, term__lt=token + '\uffff') \
+        .order_by('term').values_list('id', 'term')[:MAX_PREFIX_TERMS]
+    for term_id, term in prefix_terms:
+        matches[term_id] = EXACT_SCORE if term == token else PREFIX_SCORE
+
+    if len(token) < FUZZY_MIN_LENGTH:
+        return matches
+
+    grams = term_grams(token)
+    candidates = SearchGram.objects.filter(gram__in=grams) \
+        .values('term_id') \
+        .annotate(hits=Count('term_id')) \
+        .filter(hits__gte=max(1, len(grams) // 3)) \
+        .order_by('-hits') \
+        .values_list('term_id', flat=True)[:MAX_FUZZY_CANDIDATES]
+    candidate_ids = [i for i in candidates if i not in matches]
+
+    terms = SearchTerm.objects.filter(id__in=candidate_ids) \
+        .values_list('id', 'term')
+    for term_id, term in terms:
+        ratio = SequenceMatcher(None, token, term).ratio()
+        if ratio >= FUZZY_CUTOFF:
+            matches[term_id] = FUZZY_SCORE * ratio
+
+    return matches
+
+
+def _resolve(ranked):
+    ids = defaultdict(list)
+    for (kind, object_id), _ in ranked:
+        ids[kind].append(object_id)
+
+    names = {}
+    people = sharding.group_people(ids[SearchToken.PERSON])
+    for alias, person_ids in people.items():
+        for person in Person.objects.using(alias).filter(id__in=person_ids):
+            names[(SearchToken.PERSON, person.id)] = \
+                f"{person.first_name} {person.last_name}"
+    pets = sharding.group_pets(ids[SearchToken.PET])
+    for alias, pet_ids in pets.items():
+        for pet in Pet.objects.using(alias).filter(id__in=pet_ids):
+            names[(SearchToken.PET, pet.id)] = pet.name
+
+    results = []
+    for key, score in ranked:
+        # Rows deleted without going through the index just drop out here.
+        if key in names:
+            results.append({
+                "type": key[0],
+                "id": key[1],
+                "name": names[key],
+                "score": round(score, 3),
+            })
+
+    return results
+
+
+def _token_postings(matches):
+    """
+    Returns {(kind, object_id): best score} for one query token, reading at
+    most MAX_POSTINGS rows. Terms are read best-first, so the cap drops rows
+    that matched a weaker term before any that matched a stronger one.
+    """
+    best = {}
+    remaining = MAX_POSTINGS
+    for term_id, score in sorted(matches.items(), key=lambda m: -m[1]):
+        if remaining <= 0:
+            break
+
+        postings = list(SearchToken.objects.filter(term_id=term_id)
+                        .values_list('kind', 'object_id')[:remaining])
+        remaining -= len(postings)
+        for key in postings:
+            best.setdefault(key, score)
+
+    return best
+
+
+def _complete_postings(matches, best, candidates, batch_size=500):
+    """
+    Adds this token's score for candidate rows that the capped read in
+    _token_postings did not reach.
+    """
+    missing = defaultdict(list)
+    for kind, object_id in candidates:
+        if (kind, object_id) not in best:
+            missing[kind].append(object_id)
+
+    for kind, object_ids in missing.items():
+        for i in range(0, len(object_ids), batch_size):
+            postings = SearchToken.objects.filter(
+                kind=kind, object_id__in=object_ids[i:i + batch_size],
+                term_id__in=matches).values_list('term_id', 'object_id')
+            for term_id, object_id in postings:
+                key = (kind, object_id)
+                best[key] = max(best.get(key, 0), matches[term_id])
+
+
+def search(query, limit=10):
+    tokens = []
+    for token in tokenize(query)[:MAX_QUERY_TOKENS]:
+        matches = _matching_terms(token)
+        if matches:
+            tokens.append((matches, _token_postings(matches)))
+
+    # Rank only the rows of the most selective token that matched anything;
+    # every other token just adds its score to those rows, so the work stays
+    # bounded by MAX_POSTINGS however common the other tokens are.
+    driver = min((best for _, best in tokens if best), key=len, default={})
+    scores = dict(driver)
+    for matches, best in tokens:
+        if best is driver:
+            continue
+
+        _complete_postings(matches, best, scores)
+        for key in scores:
+            scores[key] += best.get(key, 0)
+
+    ranked = heapq.nsmallest(limit, scores.items(),
+                             key=lambda item: (-item[1], item[0]))
+
+    return _resolve(ranked)
@@ -1,9 +1,26 @@
 from rest_framework import serializers
 from django.db import models
 
+from . import search, sharding
 from .models import Person, Pet
 
 
+class OwnerField(serializers.PrimaryKeyRelatedField):
+    """
+    Looks the owner up on its own shard rather than the default database.
+    """
+
+    def to_internal_value(self, data):
+        try:
+            person_id = int(data)
+            return Person.objects.using(sharding.shard_for_person(person_id)) \
+                .get(pk=person_id)
+        except Person.DoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
 class PersonSerializer(serializers.ModelSerializer):
     first_name = models.CharField(max_length=32)
     last_name = models.CharField(max_length=32)
@@ -13,9 +30,13 @@ class PersonSerializer(serializers.ModelSerializer):
         return Person.objects.create(**validated_data)
 
     def update(self, instance, validated_data):
-        Person.objects.filter(pk=instance.id).update(**validated_data)
+        people = Person.objects.using(instance._state.db)
+        people.filter(pk=instance.id).update(**validated_data)
+        person = people.get(pk=instance.id)
+        # update() skips post_save, so keep the search index current here.
+        search.index_person(person)
 
-        return Person.objects.get(pk=instance.id)
+        return person
 
     class Meta:
         model = Person
@@ -25,15 +46,24 @@ class PersonSerializer(serializers.ModelSerializer):
 class PetSerializer(serializers.ModelSerializer):
     name = models.CharField(max_length=32)
     age = models.IntegerField(default=0)
-    owner = models.ForeignKey(Person, on_delete=models.CASCADE)
+    owner = OwnerField(queryset=Person.objects.all())
 
     def create(self, validated_data):
         return Pet.objects.create(**validated_data)
 
     def update(self, instance, validated_data):
-        Pet.objects.filter(pk=instance.id).update(**validated_data)
+        owner = validated_data.get('owner')
+        db = instance._state.db
+        if owner is not None and owner.pk != instance.owner_id:
+            sharding.move_pet(instance, owner)
+            db = owner._state.db
+
+        pets = Pet.objects.using(db)
+        pets.filter(pk=instance.id).update(**validated_data)
+        pet = pets.get(pk=instance.id)
+        search.index_pet(pet)
 
-        return Pet.objects.get(pk=instance.id)
+        return pet
 
     class Meta:
         model = Pet
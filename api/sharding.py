@@ -0,0 +1,199 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from .models import Person, Pet, PetKey, ShardBucket
+
+# Person ids hash into a fixed number of buckets; buckets map onto shard
+# aliases either by position or by an explicit ShardBucket row written by
+# the rebalance_shards command.
+BUCKET_COUNT = 1024
+BUCKET_MAP_TTL = 5.0
+
+
+def shard_aliases():
+    return list(getattr(settings, 'API_SHARDS', [DEFAULT_DB_ALIAS]))
+
+
+def catalog_alias():
+    return getattr(settings, 'API_CATALOG_DATABASE', DEFAULT_DB_ALIAS)
+
+
+def is_sharded():
+    return len(shard_aliases()) > 1
+
+
+def bucket_for_person(person_id):
+    return zlib.crc32(str(person_id).encode()) % BUCKET_COUNT
+
+
+class _BucketMap:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._overrides = None
+        self._expires = 0.0
+
+    def get(self):
+        with self._lock:
+            if self._overrides is None or self._expires <= time.monotonic():
+                self._overrides = dict(
+                    ShardBucket.objects.using(catalog_alias())
+                    .values_list('bucket', 'alias'))
+                self._expires = time.monotonic() + BUCKET_MAP_TTL
+
+            return self._overrides
+
+    def invalidate(self):
+        with self._lock:
+            self._overrides = None
+
+
+bucket_map = _BucketMap()
+
+
+def shard_for_person(person_id, pinned=None):
+    """
+    Returns the alias for person_id. pinned maps buckets to aliases on top
+    of the stored bucket map, e.g. to preview a rebalance.
+    """
+    aliases = shard_aliases()
+    if len(aliases) == 1:
+        return aliases[0]
+
+    bucket = bucket_for_person(person_id)
+    if pinned and bucket in pinned:
+        return pinned[bucket]
+
+    return bucket_map.get().get(bucket, aliases[bucket % len(aliases)])
+
+
+def shard_for_pet(pet_id):
+    """
+    Returns the alias holding pet_id, or None if no such pet was allocated.
+    """
+    aliases = shard_aliases()
+    if len(aliases) == 1:
+        return aliases[0]
+
+    owner_id = PetKey.objects.filter(pk=pet_id) \
+        .values_list('owner_id', flat=True).first()
+    if owner_id is None:
+        return None
+
+    return shard_for_person(owner_id)
+
+
+def group_people(person_ids, pinned=None):
+    groups = defaultdict(list)
+    for person_id in person_ids:
+        groups[shard_for_person(person_id, pinned)].append(person_id)
+
+    return groups
+
+
+def group_pets(pet_ids):
+    if not is_sharded():
+        return {shard_aliases()[0]: list(pet_ids)} if pet_ids else {}
+
+    groups = defaultdict(list)
+    owners = PetKey.objects.filter(pk__in=pet_ids) \
+        .values_list('id', 'owner_id')
+    for pet_id, owner_id in owners:
+        groups[shard_for_person(owner_id)].append(pet_id)
+
+    return groups
+
+
+def _run_on(fn, alias):
+    try:
+        return fn(alias)
+    finally:
+        connections[alias].close()
+
+
+def scatter(fn, aliases=None):
+    """
+    Calls fn(alias) for every shard in parallel and returns the results in
+    shard order. A single shard is queried inline on the caller's connection.
+    """
+    aliases = shard_aliases() if aliases is None else aliases
+    if len(aliases) == 1:
+        return [fn(aliases[0])]
+
+    with ThreadPoolExecutor(max_workers=len(aliases)) as executor:
+        return list(executor.map(lambda alias: _run_on(fn, alias), aliases))
+
+
+def move_pet(pet, owner):
+    """
+    Points pet at owner, moving its row if owner lives on another shard.
+
+    Each step commits on its own: the copy on the target shard, then the
+    catalog, then the delete on the source. A failure part way leaves the
+    row readable where the catalog points; at worst a stale copy is left
+    behind, never a lost row.
+    """
+    source, target = pet._state.db, owner._state.db
+    catalog = catalog_alias()
+    moving = source != target
+
+    if moving:
+        with transaction.atomic(using=target):
+            Pet.objects.using(target).bulk_create([
+                Pet(id=pet.id, name=pet.name, age=pet.age, owner_id=owner.pk)
+            ])
+
+    try:
+        with transaction.atomic(using=catalog):
+            PetKey.objects.using(catalog).filter(pk=pet.pk) \
+                .update(owner_id=owner.pk)
+    except Exception:
+        if moving:
+            Pet.objects.using(target).filter(pk=pet.pk).delete()
+        raise
+
+    if moving:
+        with transaction.atomic(using=source):
+            Pet.objects.using(source).filter(pk=pet.pk).delete()
+
+
+def copy_owners(source, target, person_ids):
+    """
+    Copies the given people and all of their pets from source to target in
+    one target transaction, leaving source untouched.
+    """
+    people = list(Person.objects.using(source).filter(id__in=person_ids))
+    pets = list(Pet.objects.using(source).filter(owner_id__in=person_ids))
+
+    with transaction.atomic(using=target):
+        Person.objects.using(target).bulk_create(people)
+        Pet.objects.using(target).bulk_create(pets)
+
+    return len(people), len(pets)
+
+
+def drop_owners(alias, person_ids):
+    """
+    Removes the given people and their pets from alias once they have been
+    copied elsewhere.
+    """
+    with transaction.atomic(using=alias):
+        Pet.objects.using(alias).filter(owner_id__in=person_ids).delete()
+        Person.objects.using(alias).filter(id__in=person_ids).delete()
+
+
+def move_owners(source, target, person_ids):
+    """
+    Copies the given people and all of their pets from source to target and
+    removes them from source. The copy commits before anything is deleted.
+    Callers should pause writes for these owners while the move runs.
+    """
+    moved = copy_owners(source, target, person_ids)
+    drop_owners(source, person_ids)
+
+    return moved
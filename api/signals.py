@@ -0,0 +1,15 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from . import search
+from .models import Person, Pet
+
+
+@receiver(post_save, sender=Person)
+def index_person(sender, instance, **kwargs):
+    search.index_person(instance)
+
+
+@receiver(post_save, sender=Pet)
+def index_pet(sender, instance, **kwargs):
+    search.index_pet(instance)
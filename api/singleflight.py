@@ -0,0 +1,108 @@
+import threading
+import time
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls for the same key into one execution.
+
+    The first caller for a key runs the loader; callers that arrive while it
+    is still running wait for it and share its result (or exception). Loaders
+    that return None are treated as "not found" and remembered for
+    negative_ttl seconds so bursts of 404s don't reach the database.
+    """
+
+    def __init__(self, negative_ttl=2.0, max_negative=10000):
+        self.negative_ttl = negative_ttl
+        self.max_negative = max_negative
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._negative = {}
+        self._stats = {
+            "calls": 0,
+            "executions": 0,
+            "coalesced": 0,
+            "negative_hits": 0,
+        }
+
+    def do(self, key, loader):
+        with self._lock:
+            self._stats["calls"] += 1
+
+            expires = self._negative.get(key)
+            if expires is not None:
+                if expires > time.monotonic():
+                    self._stats["negative_hits"] += 1
+                    return None
+                del self._negative[key]
+
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self._stats["executions"] += 1
+            else:
+                self._stats["coalesced"] += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = loader()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None and call.result is None:
+                    self._remember_missing(key)
+            call.done.set()
+
+        return call.result
+
+    def forget(self, key):
+        with self._lock:
+            self._negative.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._negative.clear()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+
+        served = stats["calls"] - stats["executions"]
+        stats["coalescing_ratio"] = \
+            served / stats["calls"] if stats["calls"] else 0.0
+
+        return stats
+
+    def _remember_missing(self, key):
+        if self.negative_ttl <= 0:
+            return
+
+        now = time.monotonic()
+        if len(self._negative) >= self.max_negative:
+            self._negative = {k: v for k, v in self._negative.items()
+                              if v > now}
+            if len(self._negative) >= self.max_negative:
+                # Dicts keep insertion order, so this drops the oldest entry.
+                del self._negative[next(iter(self._negative))]
+
+        self._negative[key] = now + self.negative_ttl
+
+
+detail_flight = SingleFlight()
@@ -1,12 +1,31 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.forms.models import model_to_dict
-from django.http import JsonResponse
-from django.test import TestCase
+from django.http import HttpResponse, JsonResponse
+from django.http import StreamingHttpResponse
+from django.db import DatabaseError, connection, connections
+from django.core.cache import cache
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from rest_framework.parsers import JSONParser
+import gzip
 import io
 import json
+import threading
+import time
+from unittest import mock, skipUnless
 
+from . import admin as api_admin
+from . import checks
+from . import counting, deletion, negotiation, search, sharding, views
+from .idempotency import IdempotencyStore
+from .middleware import CompressionMiddleware, brotli
+from .models import Person, Pet, PetKey, SearchToken, ShardBucket
 from .serializers import PersonSerializer, PetSerializer
+from .singleflight import SingleFlight, detail_flight
 
 
 def get_person_data():
@@ -354,3 +373,894 @@ class PetDetailTests(TestCase):
         self.assertEqual(json.dumps(json.loads(response.content),
                                     sort_keys=True),
                          json.dumps(expected, sort_keys=True))
+
+
+###############################################################################
+# Single-flight detail lookups
+###############################################################################
+class SingleFlightTests(TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        executions = []
+
+        def loader():
+            executions.append(1)
+            started.set()
+            release.wait(5)
+            return {"id": 1}
+
+        results = []
+        leader = threading.Thread(
+            target=lambda: results.append(flight.do('k', loader)))
+        leader.start()
+        started.wait(5)
+
+        followers = [threading.Thread(
+            target=lambda: results.append(flight.do('k', loader)))
+            for _ in range(4)]
+        for t in followers:
+            t.start()
+        while flight.stats()['coalesced'] < 4:
+            time.sleep(0.001)
+        release.set()
+        for t in [leader] + followers:
+            t.join(5)
+
+        self.assertEqual(len(executions), 1)
+        self.assertEqual(results, [{"id": 1}] * 5)
+        self.assertEqual(flight.stats()['coalescing_ratio'], 0.8)
+
+    def test_errors_propagate_and_are_not_cached(self):
+        flight = SingleFlight()
+
+        def loader():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            flight.do('k', loader)
+        self.assertEqual(flight.do('k', lambda: 1), 1)
+
+    def test_missing_results_are_negatively_cached(self):
+        flight = SingleFlight(negative_ttl=60)
+        calls = []
+
+        def loader():
+            calls.append(1)
+            return None
+
+        self.assertIsNone(flight.do('k', loader))
+        self.assertIsNone(flight.do('k', loader))
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(flight.stats()['negative_hits'], 1)
+
+        flight.forget('k')
+        self.assertEqual(flight.do('k', lambda: 2), 2)
+
+    def test_negative_cache_is_bounded(self):
+        flight = SingleFlight(negative_ttl=60, max_negative=2)
+        for key in ('a', 'b', 'c'):
+            flight.do(key, lambda: None)
+
+        self.assertEqual(flight.do('a', lambda: 1), 1)
+
+    def test_repeated_404_served_from_negative_cache(self):
+        detail_flight.clear()
+        self.client.get(f"/people/{9999}/")
+        hits = detail_flight.stats()['negative_hits']
+
+        response = self.client.get(f"/people/{9999}/")
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(detail_flight.stats()['negative_hits'], hits + 1)
+
+    def test_metrics_endpoint(self):
+        response = self.client.get(reverse('api:metrics'))
+        self.assertIn('coalescing_ratio',
+                      json.loads(response.content)['detail_lookups'])
+
+
+###############################################################################
+# /search/
+###############################################################################
+class SearchTests(TestCase):
+    def search(self, query):
+        response = self.client.get(reverse('api:search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)['results']
+
+    def test_missing_query_400_status_code(self):
+        response = self.client.get(reverse('api:search'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_prefix_match(self):
+        person = create_person()
+        results = self.search("jes")
+        self.assertEqual(results[0]['type'], 'person')
+        self.assertEqual(results[0]['id'], person.id)
+        self.assertEqual(results[0]['name'], "Jesse Sublett")
+
+    def test_fuzzy_match(self):
+        person = create_person()
+        pet = create_pet(person.id)
+
+        self.assertEqual(self.search("Sublet")[0]['id'], person.id)
+        self.assertEqual(self.search("Sublettt")[0]['id'], person.id)
+
+        results = self.search("igy")
+        self.assertEqual(results[0]['type'], 'pet')
+        self.assertEqual(results[0]['id'], pet.id)
+
+    def test_exact_match_ranks_first(self):
+        create_person()
+        other = PersonSerializer(data={"first_name": "Jess",
+                                       "last_name": "Jones",
+                                       "age": 30})
+        other.is_valid()
+        other = other.save()
+
+        self.assertEqual(self.search("jess")[0]['id'], other.id)
+
+    def test_index_follows_updates(self):
+        person = create_person()
+        self.client.put(f"/people/{person.id}/",
+                        content_type='application/json',
+                        data={"first_name": "Walter"})
+
+        self.assertEqual(self.search("jesse"), [])
+        self.assertEqual(self.search("walt")[0]['id'], person.id)
+
+    def test_accents_are_normalized(self):
+        person = create_person()
+        self.assertEqual(self.search("Jéssé")[0]['id'], person.id)
+
+    def create_named(self, first_name, last_name):
+        serializer = PersonSerializer(data={"first_name": first_name,
+                                            "last_name": last_name,
+                                            "age": 30})
+        serializer.is_valid()
+        return serializer.save()
+
+    def test_exact_match_survives_postings_cap(self):
+        with mock.patch.object(search, 'MAX_POSTINGS', 20):
+            for n in range(30):
+                self.create_named("Anna", f"Q{n}")
+            ann = self.create_named("Ann", "Zed")
+            anna_smith = self.create_named("Anna", "Smith")
+
+            self.assertEqual(self.search("ann")[0]['id'], ann.id)
+
+            response = self.client.get(reverse('api:search'),
+                                       {'q': "anna smith", 'limit': 3})
+            results = json.loads(response.content)['results']
+            self.assertEqual(results[0]['id'], anna_smith.id)
+            self.assertEqual(results[0]['score'], 2.0)
+
+
+    def count_search_queries(self, query):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.search(query)
+
+        return len(queries), results
+
+    def test_postings_reads_are_bounded(self):
+        with mock.patch.object(search, 'MAX_POSTINGS', 20):
+            john_smith = self.create_named("John", "Smith")
+            for n in range(25):
+                self.create_named("John", f"Q{n}")
+            few = self.count_search_queries("john smith")
+
+            for n in range(25, 75):
+                self.create_named("John", f"Q{n}")
+            many = self.count_search_queries("john smith")
+            self.assertEqual(many[0], few[0])
+            self.assertEqual(many[1][0]['id'], john_smith.id)
+            self.assertEqual(many[1][0]['score'], 2.0)
+
+            postings = search._token_postings(search._matching_terms("john"))
+            self.assertEqual(len(postings), 20)
+
+
+###############################################################################
+# Sharding
+#
+# Run with several SQLite shards:
+#   python manage.py test api.tests.ShardingTests \
+#       --settings=apitemplate.settings_sharded
+###############################################################################
+@skipUnless(len(getattr(settings, 'API_SHARDS', [])) > 1,
+            "requires more than one shard in API_SHARDS")
+class ShardingTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        sharding.bucket_map.invalidate()
+        detail_flight.clear()
+
+    def create_people(self, count):
+        return [create_person(with_pets=True) for _ in range(count)]
+
+    def test_person_and_pets_share_a_shard(self):
+        people = self.create_people(12)
+        used = set()
+        for person in people:
+            alias = sharding.shard_for_person(person.id)
+            used.add(alias)
+            self.assertEqual(person._state.db, alias)
+            self.assertTrue(Person.objects.using(alias)
+                            .filter(pk=person.id).exists())
+            self.assertEqual(Pet.objects.using(alias)
+                             .filter(owner_id=person.id).count(), 1)
+
+        self.assertGreater(len(used), 1)
+
+    def test_list_merges_shards_in_id_order(self):
+        people = self.create_people(12)
+        response = self.client.get(reverse('api:people'))
+        ids = [p['id'] for p in json.loads(response.content)['people']]
+        self.assertEqual(ids, sorted(p.id for p in people))
+
+        response = self.client.get(reverse('api:pets'),
+                                   {'after': ids[0], 'limit': 5})
+        pets = json.loads(response.content)['pets']
+        self.assertEqual(len(pets), 5)
+        self.assertEqual([p['id'] for p in pets],
+                         sorted(p['id'] for p in pets))
+        self.assertTrue(all(p['owner']['id'] > ids[0] for p in pets))
+
+    def test_detail_endpoints(self):
+        person = create_person()
+        pet = create_pet(person.id)
+
+        response = self.client.get(f"/people/{person.id}/")
+        self.assertEqual(json.loads(response.content)['person']['pets'][0]
+                         ['id'], pet.id)
+        response = self.client.get(f"/pets/{pet.id}/")
+        self.assertEqual(json.loads(response.content)['pet']['owner']['id'],
+                         person.id)
+
+    def test_pet_follows_new_owner(self):
+        people = self.create_people(12)
+        source = people[0]
+        target = next(p for p in people
+                      if p._state.db != source._state.db)
+        pet = source.get_pets()[0]
+
+        response = self.client.put(f"/pets/{pet.id}/",
+                                   content_type='application/json',
+                                   data={'owner': target.id})
+        self.assertEqual(json.loads(response.content)['owner']['id'],
+                         target.id)
+        self.assertFalse(Pet.objects.using(source._state.db)
+                         .filter(pk=pet.id).exists())
+        self.assertEqual(sharding.shard_for_pet(pet.id), target._state.db)
+
+    def test_failed_pet_move_keeps_source_row(self):
+        people = self.create_people(12)
+        source = people[0]
+        target = next(p for p in people
+                      if p._state.db != source._state.db)
+        pet = source.get_pets()[0]
+
+        with mock.patch.object(connections[target._state.db], 'commit',
+                               side_effect=DatabaseError("commit failed")), \
+                self.assertRaises(DatabaseError):
+            sharding.move_pet(pet, target)
+
+        self.assertTrue(Pet.objects.using(source._state.db)
+                        .filter(pk=pet.id, owner_id=source.id).exists())
+        self.assertFalse(Pet.objects.using(target._state.db)
+                         .filter(pk=pet.id).exists())
+        self.assertEqual(PetKey.objects.get(pk=pet.id).owner_id, source.id)
+
+    def test_rebalance_pins_bucket_after_copy(self):
+        person = create_person(with_pets=True)
+        source = person._state.db
+        target = next(a for a in settings.API_SHARDS
+                      if a not in (source, sharding.catalog_alias()))
+        bucket = sharding.bucket_for_person(person.id)
+
+        with mock.patch.object(connections[target], 'commit',
+                               side_effect=DatabaseError("commit failed")), \
+                self.assertRaises(DatabaseError):
+            call_command('rebalance_shards', bucket=bucket, to=target,
+                         stdout=io.StringIO())
+
+        self.assertFalse(ShardBucket.objects.filter(bucket=bucket).exists())
+        self.assertEqual(sharding.shard_for_person(person.id), source)
+        self.assertTrue(Person.objects.using(source)
+                        .filter(pk=person.id).exists())
+        self.assertEqual(Pet.objects.using(source)
+                         .filter(owner_id=person.id).count(), 1)
+
+    def test_rebalance_moves_owner_and_pets(self):
+        person = create_person(with_pets=True)
+        source = person._state.db
+        target = next(a for a in settings.API_SHARDS if a != source)
+
+        bucket = sharding.bucket_for_person(person.id)
+        out = io.StringIO()
+        call_command('rebalance_shards', bucket=bucket, to=target,
+                     dry_run=True, stdout=out)
+        self.assertIn("Would move 1 people and 1 pets.", out.getvalue())
+        self.assertEqual(sharding.shard_for_person(person.id), source)
+
+        call_command('rebalance_shards', bucket=bucket, to=target,
+                     stdout=io.StringIO())
+
+        self.assertEqual(sharding.shard_for_person(person.id), target)
+        self.assertFalse(Person.objects.using(source)
+                         .filter(pk=person.id).exists())
+        self.assertEqual(Pet.objects.using(target)
+                         .filter(owner_id=person.id).count(), 1)
+        response = self.client.get(f"/people/{person.id}/")
+        self.assertEqual(len(json.loads(response.content)['person']['pets']),
+                         1)
+
+    def test_bulk_delete_spans_shards(self):
+        self.create_people(12)
+        response = self.client.delete(f"{reverse('api:people')}?age_gt=18")
+        self.assertEqual(json.loads(response.content),
+                         {"deleted": {"people": 12, "pets": 12}})
+        for alias in settings.API_SHARDS:
+            self.assertFalse(Pet.objects.using(alias).exists())
+
+
+###############################################################################
+# Content negotiation and compression
+###############################################################################
+class NegotiationTests(TestCase):
+    def test_accept_header_parsing(self):
+        accepted = negotiation.parse_header_values(
+            "application/json;q=0.5, application/msgpack, */*;q=0.1")
+        self.assertEqual(accepted, {"application/json": 0.5,
+                                    "application/msgpack": 1.0,
+                                    "*/*": 0.1})
+
+    def test_json_is_default(self):
+        create_person()
+        response = self.client.get(reverse('api:people'),
+                                   HTTP_ACCEPT="*/*")
+        self.assertIs(type(response), JsonResponse)
+        self.assertIn('Accept', response['Vary'])
+
+    @skipUnless(negotiation.msgpack, "msgpack is not installed")
+    def test_get_msgpack_response(self):
+        person = create_person()
+        response = self.client.get(f"/people/{person.id}/",
+                                   HTTP_ACCEPT="application/msgpack")
+        self.assertEqual(response['Content-Type'], "application/msgpack")
+        data = negotiation.msgpack.unpackb(response.content)
+        self.assertEqual(data['person']['id'], person.id)
+
+    @skipUnless(negotiation.msgpack, "msgpack is not installed")
+    def test_post_msgpack_body(self):
+        response = self.client.post(
+            reverse('api:people'),
+            content_type='application/msgpack',
+            data=negotiation.msgpack.packb(get_person_data()))
+        data = json.loads(response.content)
+        self.assertEqual(data['first_name'], "Jesse")
+
+
+class CompressionTests(TestCase):
+    def setUp(self):
+        for _ in range(20):
+            create_person(with_pets=True)
+
+    def test_gzip_large_response(self):
+        response = self.client.get(reverse('api:people'),
+                                   HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response['Content-Encoding'], "gzip")
+        data = json.loads(gzip.decompress(response.content))
+        self.assertEqual(len(data['people']), 20)
+
+    def test_identity_without_accept_encoding(self):
+        response = self.client.get(reverse('api:people'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_small_response_not_compressed(self):
+        response = self.client.get(reverse('api:index'),
+                                   HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_gzip_refused_by_q_zero(self):
+        response = self.client.get(reverse('api:people'),
+                                   HTTP_ACCEPT_ENCODING="gzip;q=0")
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_html_not_compressed(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING="gzip")
+        middleware = CompressionMiddleware(
+            lambda r: HttpResponse(b"<p>csrf</p>" * 200))
+        response = middleware(request)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+        user = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        response = self.client.get('/admin/api/person/',
+                                   HTTP_ACCEPT_ENCODING="gzip")
+        self.assertGreater(len(response.content), 1024)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streaming_response(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING="gzip")
+        middleware = CompressionMiddleware(lambda r: StreamingHttpResponse(
+            [b"a" * 10, b"b" * 10], content_type="application/json"))
+        response = middleware(request)
+        self.assertEqual(response['Content-Encoding'], "gzip")
+        self.assertEqual(
+            gzip.decompress(b"".join(response.streaming_content)),
+            b"a" * 10 + b"b" * 10)
+
+    @skipUnless(brotli, "brotli is not installed")
+    def test_streaming_brotli_flushes_each_chunk(self):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING="br")
+        middleware = CompressionMiddleware(lambda r: StreamingHttpResponse(
+            [b"a" * 10, b"b" * 10], content_type="application/json"))
+        response = middleware(request)
+        self.assertEqual(response['Content-Encoding'], "br")
+
+        chunks = iter(response.streaming_content)
+        first = next(chunks)
+        self.assertNotEqual(first, b"")
+        self.assertEqual(brotli.decompress(first + b"".join(chunks)),
+                         b"a" * 10 + b"b" * 10)
+
+
+###############################################################################
+# DELETE
+###############################################################################
+class DeleteTests(TestCase):
+    def create_person_aged(self, age):
+        serializer = PersonSerializer(data={**get_person_data(), 'age': age})
+        serializer.is_valid()
+        person = serializer.save()
+        create_pet(person.id)
+        create_pet(person.id)
+
+        return person
+
+    def test_delete_person_removes_pets(self):
+        person = create_person(with_pets=True)
+        create_pet(person.id)
+
+        response = self.client.delete(f"/people/{person.id}/")
+        self.assertEqual(json.loads(response.content),
+                         {"deleted": {"people": 1, "pets": 2}})
+        self.assertFalse(Person.objects.filter(pk=person.id).exists())
+        self.assertFalse(Pet.objects.filter(owner_id=person.id).exists())
+        self.assertFalse(PetKey.objects.filter(owner_id=person.id).exists())
+        self.assertFalse(SearchToken.objects.exists())
+
+    def test_delete_person_404_status_code(self):
+        response = self.client.delete(f"/people/{9999}/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_delete_pet(self):
+        person = create_person(with_pets=True)
+        pet = create_pet(person.id)
+
+        response = self.client.delete(f"/pets/{pet.id}/")
+        self.assertEqual(json.loads(response.content),
+                         {"deleted": {"pets": 1}})
+        self.assertEqual(person.get_pets().count(), 1)
+        self.assertEqual(self.client.get(f"/pets/{pet.id}/").status_code,
+                         404)
+
+    def test_delete_pet_404_status_code(self):
+        response = self.client.delete(f"/pets/{9999}/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_bulk_delete_by_age(self):
+        young = [self.create_person_aged(age) for age in (3, 10, 17)]
+        old = self.create_person_aged(40)
+
+        response = self.client.delete(f"{reverse('api:people')}?age_lt=18")
+        self.assertEqual(json.loads(response.content),
+                         {"deleted": {"people": 3, "pets": 6}})
+        self.assertEqual(list(Person.objects.values_list('id', flat=True)),
+                         [old.id])
+        self.assertFalse(Pet.objects.filter(
+            owner_id__in=[p.id for p in young]).exists())
+
+    def test_delete_with_csrf_checks_enforced(self):
+        client = Client(enforce_csrf_checks=True)
+        person = create_person()
+        pet = create_pet(person.id)
+
+        self.assertEqual(client.delete(f"/pets/{pet.id}/").status_code, 200)
+        self.assertEqual(client.delete(f"/people/{person.id}/").status_code,
+                         200)
+
+    def test_bulk_delete_pages_past_earlier_matches(self):
+        young = [self.create_person_aged(age) for age in (1, 2, 3)]
+        old = self.create_person_aged(40)
+
+        with mock.patch.object(deletion, 'BATCH_SIZE', 1), \
+                CaptureQueriesContext(connection) as queries:
+            self.client.delete(f"{reverse('api:people')}?age_lt=18")
+
+        self.assertEqual(list(Person.objects.values_list('id', flat=True)),
+                         [old.id])
+        selects = [q['sql'] for q in queries
+                   if q['sql'].startswith('SELECT "api_person"."id"')]
+        self.assertIn(f'"api_person"."id" > {young[-1].id}', selects[-1])
+
+    def test_bulk_delete_requires_filter(self):
+        create_person()
+        response = self.client.delete(reverse('api:people'))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Person.objects.count(), 1)
+
+
+###############################################################################
+# /admin/
+###############################################################################
+class AdminTests(TestCase):
+    def setUp(self):
+        user = get_user_model().objects.create_superuser(
+            'admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        return len(queries)
+
+    def test_pet_changelist_queries_do_not_grow_with_rows(self):
+        person = create_person()
+        for _ in range(3):
+            create_pet(person.id)
+        few = self.count_queries('/admin/api/pet/')
+
+        for _ in range(10):
+            create_pet(create_person().id)
+        many = self.count_queries('/admin/api/pet/')
+
+        self.assertEqual(few, many)
+
+    def test_inline_pets_are_capped(self):
+        person = create_person()
+        for _ in range(api_admin.INLINE_PET_LIMIT + 5):
+            create_pet(person.id)
+
+        response = self.client.get(f'/admin/api/person/{person.id}/change/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            response,
+            f'name="pets-INITIAL_FORMS" value="'
+            f'{api_admin.INLINE_PET_LIMIT}"')
+
+    def test_inline_queries_do_not_grow_with_pets(self):
+        person = create_person()
+        for _ in range(3):
+            create_pet(person.id)
+        url = f'/admin/api/person/{person.id}/change/'
+        few = self.count_queries(url)
+
+        for _ in range(20):
+            create_pet(person.id)
+        many = self.count_queries(url)
+
+        self.assertEqual(few, many)
+
+    def test_person_search_uses_prefix(self):
+        create_person()
+        cell = '<td class="field-first_name">Jesse</td>'
+        response = self.client.get('/admin/api/person/', {'q': 'Jes'})
+        self.assertContains(response, cell)
+        response = self.client.get('/admin/api/person/', {'q': 'esse'})
+        self.assertNotContains(response, cell)
+
+    def test_delete_summarizes_pets(self):
+        person = create_person(with_pets=True)
+        response = self.client.post(f'/admin/api/person/{person.id}/delete/',
+                                    {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Pet.objects.filter(owner_id=person.id).exists())
+
+    def test_read_only_with_warning_when_sharded(self):
+        person = create_person()
+        with override_settings(API_SHARDS=['default', 'shard_1']):
+            response = self.client.get('/admin/api/person/')
+            self.assertContains(response, "split across API_SHARDS")
+
+            response = self.client.post(
+                f'/admin/api/person/{person.id}/change/',
+                {'first_name': 'X', 'last_name': 'Y', 'age': 1})
+            self.assertEqual(response.status_code, 403)
+            self.assertEqual(
+                self.client.get('/admin/api/pet/add/').status_code, 403)
+
+            self.assertEqual(
+                [w.id for w in checks.check_admin_sharding(None)],
+                ['api.W001'])
+
+    @skipUnless(connection.vendor == 'sqlite', "uses sqlite_stat1")
+    @override_settings(API_EXACT_COUNT_THRESHOLD=0,
+                       API_ESTIMATED_COUNT_THRESHOLD=0)
+    def test_changelist_uses_table_statistics(self):
+        for _ in range(3):
+            create_person()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+        self.assertEqual(counting.estimate_count(Person, 'default'), 3)
+
+        # The estimate lags behind until statistics are refreshed.
+        create_person()
+        response = self.client.get('/admin/api/person/')
+        self.assertEqual(response.context['cl'].result_count, 3)
+
+
+###############################################################################
+# X-Total-Count
+###############################################################################
+class TotalCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for _ in range(3):
+            create_person(with_pets=True)
+
+    def analyze(self):
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def test_head_people(self):
+        response = self.client.head(reverse('api:people'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Total-Count'], '3')
+        self.assertEqual(response.content, b'')
+
+    def test_get_pets_has_total_count(self):
+        response = self.client.get(reverse('api:pets'), {'limit': 1})
+        self.assertEqual(len(json.loads(response.content)['pets']), 1)
+        self.assertEqual(response['X-Total-Count'], '3')
+
+    @skipUnless(connection.vendor == 'sqlite', "uses sqlite_stat1")
+    @override_settings(API_EXACT_COUNT_THRESHOLD=0,
+                       API_ESTIMATED_COUNT_THRESHOLD=0)
+    def test_large_tables_use_estimate(self):
+        self.analyze()
+        create_person()
+
+        response = self.client.head(reverse('api:people'))
+        self.assertEqual(response['X-Total-Count'], '3')
+        response = self.client.head(reverse('api:people'),
+                                    {'exact_count': 'true'})
+        self.assertEqual(response['X-Total-Count'], '4')
+
+    @skipUnless(connection.vendor == 'sqlite', "uses sqlite_stat1")
+    @override_settings(API_EXACT_COUNT_THRESHOLD=0)
+    def test_mid_sized_tables_use_cached_count(self):
+        self.analyze()
+        self.assertEqual(self.client.head(reverse('api:people'))
+                         ['X-Total-Count'], '3')
+
+        create_person()
+        person = create_person()
+        self.assertEqual(self.client.head(reverse('api:people'))
+                         ['X-Total-Count'], '3')
+
+        # Deletes drop the cached value.
+        self.client.delete(f"/people/{person.id}/")
+        self.assertEqual(self.client.head(reverse('api:people'))
+                         ['X-Total-Count'], '4')
+
+
+    def mysql_estimate(self, cursor):
+        cursor.__enter__.return_value = cursor
+        cursor.fetchone.return_value = (5,)
+        db = connections['default']
+        with mock.patch.object(db, 'vendor', 'mysql'), \
+                mock.patch.object(db, 'cursor', return_value=cursor):
+            estimate = counting.estimate_count(Person, 'default')
+        self.assertEqual(estimate, 5)
+
+        return [c.args[0] for c in cursor.execute.call_args_list]
+
+    def test_mysql_reads_innodb_statistics(self):
+        queries = self.mysql_estimate(mock.MagicMock())
+        self.assertEqual(len(queries), 1)
+        self.assertIn("mysql.innodb_table_stats", queries[0])
+
+    def test_mysql_disables_information_schema_cache(self):
+        cursor = mock.MagicMock()
+        cursor.execute.side_effect = [DatabaseError("denied"), None, None]
+        queries = self.mysql_estimate(cursor)
+        self.assertEqual(queries[1],
+                         "SET SESSION information_schema_stats_expiry = 0")
+        self.assertIn("information_schema.TABLES", queries[2])
+
+
+###############################################################################
+# Idempotency-Key
+###############################################################################
+class IdempotencyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def post_person(self, key, data=None):
+        return self.client.post(reverse('api:people'),
+                                content_type='application/json',
+                                data=data or get_person_data(),
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_stored_response(self):
+        first = self.post_person('abc')
+        with CaptureQueriesContext(connection) as queries:
+            second = self.post_person('abc')
+
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(Person.objects.count(), 1)
+
+    def test_different_keys_create_rows(self):
+        self.post_person('abc')
+        self.post_person('def')
+        self.assertEqual(Person.objects.count(), 2)
+
+    def test_keys_are_scoped_to_endpoint(self):
+        person = create_person()
+        self.post_person('abc')
+        response = self.client.post(reverse('api:pets'),
+                                    content_type='application/json',
+                                    data=get_pet_data(person.id),
+                                    HTTP_IDEMPOTENCY_KEY='abc')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Pet.objects.count(), 1)
+
+    def test_reused_key_with_different_body_422_status_code(self):
+        self.post_person('abc')
+        response = self.post_person('abc', {**get_person_data(), 'age': 1})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Person.objects.count(), 1)
+
+    def test_replay_across_workers(self):
+        calls = []
+
+        def view():
+            calls.append(1)
+            return JsonResponse({"id": 1})
+
+        IdempotencyStore().run('k', 'f', view)
+        response = IdempotencyStore().run('k', 'f', view)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+    def test_entries_expire(self):
+        store = IdempotencyStore(ttl=0)
+        store.run('a', 'f', lambda: JsonResponse({}))
+        self.assertIsNone(store.get('a'))
+
+    def test_concurrent_duplicate_waits_for_first(self):
+        store = IdempotencyStore()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def view():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return JsonResponse({"id": 1})
+
+        responses = []
+        first = threading.Thread(
+            target=lambda: responses.append(store.run('k', 'f', view)))
+        first.start()
+        started.wait(5)
+        second = threading.Thread(
+            target=lambda: responses.append(store.run('k', 'f', view)))
+        second.start()
+        while store._flight.stats()['coalesced'] < 1:
+            time.sleep(0.001)
+        release.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([r.content for r in responses],
+                         [b'{"id": 1}'] * 2)
+
+    def test_duplicate_in_other_worker_waits_for_first(self):
+        first_worker, second_worker = IdempotencyStore(), IdempotencyStore()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def view():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return JsonResponse({"id": 1})
+
+        responses = []
+        first = threading.Thread(
+            target=lambda: responses.append(
+                first_worker.run('k', 'f', view)))
+        first.start()
+        started.wait(5)
+        second = threading.Thread(
+            target=lambda: responses.append(
+                second_worker.run('k', 'f', view)))
+        second.start()
+        time.sleep(0.1)
+        release.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(responses[1]['Idempotent-Replayed'], 'true')
+
+    def test_in_flight_timeout_409_status_code(self):
+        store = IdempotencyStore(lock_timeout=0)
+        entry_key, lock_key = store._cache_keys(('/people/', 'abc'))
+        cache.add(lock_key, True, 60)
+
+        with mock.patch('api.idempotency.store', store):
+            response = self.post_person('abc')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Person.objects.count(), 0)
+
+
+###############################################################################
+# /people/{id}/pets/
+###############################################################################
+class PersonPetsTests(TestCase):
+    def setUp(self):
+        self.person = create_person()
+        self.pets = [create_pet(self.person.id) for _ in range(5)]
+
+    def test_get_pets_is_cached(self):
+        person = Person.objects.get(pk=self.person.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(len(person.get_pets()), 5)
+            self.assertEqual(len(person.get_pets()), 5)
+
+    def test_get_pets_uses_prefetch(self):
+        people = list(Person.objects.prefetch_related('pets'))
+        with self.assertNumQueries(0):
+            self.assertEqual(len(people[0].get_pets()), 5)
+
+    def test_people_list_queries_do_not_grow_with_rows(self):
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse('api:people'))
+        for _ in range(5):
+            create_person(with_pets=True)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse('api:people'))
+
+        self.assertEqual(len(few), len(many))
+
+    def test_paginated_sub_resource(self):
+        url = f"/people/{self.person.id}/pets/"
+        response = self.client.get(url, {'limit': 2})
+        data = json.loads(response.content)
+        self.assertEqual([p['id'] for p in data['pets']],
+                         [p.id for p in self.pets[:2]])
+
+        seen = [p['id'] for p in data['pets']]
+        while data['next']:
+            data = json.loads(self.client.get(data['next']).content)
+            seen += [p['id'] for p in data['pets']]
+        self.assertEqual(seen, [p.id for p in self.pets])
+
+    def test_sub_resource_404_status_code(self):
+        response = self.client.get(f"/people/{9999}/pets/")
+        self.assertEqual(response.status_code, 404)
+
+    def test_detail_embeds_bounded_pets(self):
+        with mock.patch.object(views, 'DETAIL_PET_LIMIT', 2):
+            response = self.client.get(f"/people/{self.person.id}/")
+        person = json.loads(response.content)['person']
+
+        self.assertEqual(len(person['pets']), 2)
+        self.assertEqual(person['pets_next'],
+                         f"/people/{self.person.id}/pets/"
+                         f"?after={self.pets[1].id}")
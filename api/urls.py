@@ -5,8 +5,11 @@ from . import views
 app_name = 'api'
 urlpatterns = [
     path('', views.index, name='index'),
+    path('metrics/', views.metrics, name='metrics'),
     path('people/', views.people, name='people'),
     path('people/<int:person_id>/', views.person_detail, name='person detail'),
+    path('people/<int:person_id>/pets/', views.person_pets, name='person pets'),
     path('pets/', views.pets, name='pets'),
     path('pets/<int:pet_id>/', views.pet_detail, name='person detail'),
+    path('search/', views.search, name='search'),
 ]
@@ -1,113 +1,324 @@
 from django.forms.models import model_to_dict
-from django.http import Http404, JsonResponse
+from django.http import Http404, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_GET, require_http_methods
-from rest_framework.parsers import JSONParser
-import io
+import heapq
+import itertools
 
+from . import counting, deletion, sharding
+from . import search as search_index
+from .idempotency import idempotent
 from .models import Person, Pet
+from .negotiation import parse_body, render
 
 from .serializers import PersonSerializer, PetSerializer
+from .singleflight import detail_flight
+
+# person_detail embeds at most this many pets and links to
+# /people/<id>/pets/ for the rest.
+DETAIL_PET_LIMIT = 100
+PET_PAGE_LIMIT = 100
+MAX_PET_PAGE_LIMIT = 1000
 
 
 @require_GET
 def index(request):
-    return JsonResponse({"endpoints": [
+    return render(request, {"endpoints": [
         "people/",
-        "pets/"
+        "pets/",
+        "search/"
     ]})
 
 
-@require_http_methods(['GET', 'POST', 'PUT'])
+@require_GET
+def search(request):
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return render(request, {"error": "Missing search query 'q'"},
+                      status=400)
+
+    try:
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        return render(request, {"error": "'limit' must be an integer"},
+                      status=400)
+
+    return render(request, {"results": search_index.search(query, limit)})
+
+
+@require_GET
+def metrics(request):
+    return render(request, {"detail_lookups": detail_flight.stats()})
+
+
+def get_person(person_id):
+    return Person.objects.using(sharding.shard_for_person(person_id)) \
+        .get(pk=person_id)
+
+
+def get_pet(pet_id):
+    return Pet.objects.using(sharding.shard_for_pet(pet_id)) \
+        .select_related('owner').get(pk=pet_id)
+
+
+def get_page_params(request):
+    """
+    Returns (after, limit) from the query string; limit is None when the
+    caller wants everything.
+    """
+    after = int(request.GET.get('after', 0))
+    limit = request.GET.get('limit')
+    limit = max(int(limit), 1) if limit is not None else None
+
+    return after, limit
+
+
+def get_delete_filters(request):
+    """
+    Returns ORM filters for a bulk delete from ?age_lt=, ?age_lte=, ?age_gt=
+    and ?age_gte=.
+    """
+    filters = {}
+    for param in ('age_lt', 'age_lte', 'age_gt', 'age_gte'):
+        if param in request.GET:
+            lookup = param.replace('_', '__', 1)
+            filters[lookup] = int(request.GET[param])
+
+    return filters
+
+
+def with_total_count(request, response, model):
+    exact = request.GET.get('exact_count', '').lower() in ('1', 'true', 'yes')
+    response['X-Total-Count'] = counting.total_count(model, exact=exact)
+
+    return response
+
+
+def merge_pages(pages, limit):
+    merged = heapq.merge(*pages, key=lambda row: row['id'])
+    if limit is not None:
+        merged = itertools.islice(merged, limit)
+
+    return list(merged)
+
+
+def load_people_page(alias, after, limit):
+    people_query = Person.objects.using(alias).filter(id__gt=after) \
+        .order_by('id').prefetch_related('pets')
+    if limit is not None:
+        people_query = people_query[:limit]
+
+    people_list = []
+    for p in people_query:
+        person_and_pets = model_to_dict(p)
+        person_and_pets['pets'] = [model_to_dict(pet) for pet in p.get_pets()]
+        people_list.append(person_and_pets)
+
+    return people_list
+
+
+def load_pets_page(alias, after, limit):
+    pets_query = Pet.objects.using(alias).select_related('owner') \
+        .filter(id__gt=after).order_by('id')
+    if limit is not None:
+        pets_query = pets_query[:limit]
+
+    pets_list = []
+    for pet in pets_query:
+        pet_dict = model_to_dict(pet)
+        pet_dict['owner'] = model_to_dict(pet.owner)
+        pets_list.append(pet_dict)
+
+    return pets_list
+
+
+def load_pets_of(person_id, after, limit):
+    """
+    Returns one page of a person's pets in id order and the id to continue
+    after, or None on the last page.
+    """
+    pets_query = Pet.objects.using(sharding.shard_for_person(person_id)) \
+        .filter(owner_id=person_id, id__gt=after).order_by('id')
+    pets_list = [model_to_dict(pet) for pet in pets_query[:limit + 1]]
+    if len(pets_list) > limit:
+        pets_list = pets_list[:limit]
+        return pets_list, pets_list[-1]['id']
+
+    return pets_list, None
+
+
+def load_person(person_id):
+    try:
+        person = get_person(person_id)
+    except Person.DoesNotExist:
+        return None
+
+    person_dict = model_to_dict(person)
+    person_dict['pets'], next_after = load_pets_of(person_id, 0,
+                                                   DETAIL_PET_LIMIT)
+    if next_after is not None:
+        person_dict['pets_next'] = \
+            f"/people/{person_id}/pets/?after={next_after}"
+
+    return person_dict
+
+
+def load_pet(pet_id):
+    try:
+        pet = get_pet(pet_id)
+    except Pet.DoesNotExist:
+        return None
+
+    pet_dict = model_to_dict(pet)
+    pet_dict['owner'] = model_to_dict(pet.owner)
+
+    return pet_dict
+
+
+@require_http_methods(['GET', 'HEAD', 'POST', 'PUT', 'DELETE'])
 @csrf_exempt
+@idempotent
 def people(request):
-    if request.method == 'GET':
-        people_query = Person.objects.all()
-        people_list = []
-        for p in people_query:
-            person_and_pets = model_to_dict(p)
-            person_and_pets['pets'] = [model_to_dict(pet) for pet in p.get_pets()]
-            people_list.append(person_and_pets)
+    if request.method == 'HEAD':
+        return with_total_count(request, HttpResponse(), Person)
+
+    elif request.method == 'GET':
+        try:
+            after, limit = get_page_params(request)
+        except ValueError:
+            return render(request, {"error": "'after' and 'limit' must "
+                                             "be integers"}, status=400)
+
+        pages = sharding.scatter(
+            lambda alias: load_people_page(alias, after, limit))
 
-        return JsonResponse({"people": people_list})
+        response = render(request, {"people": merge_pages(pages, limit)})
+
+        return with_total_count(request, response, Person)
 
     elif request.method == 'POST':
-        stream = io.BytesIO(request.body)
-        data = JSONParser().parse(stream)
+        data = parse_body(request)
         serializer = PersonSerializer(data=data)
         serializer.is_valid()
         person = serializer.save()
+        detail_flight.forget(('person', person.id))
 
-        return JsonResponse(model_to_dict(person))
+        return render(request, model_to_dict(person))
 
     elif request.method == 'PUT':
-        stream = io.BytesIO(request.body)
-        data = JSONParser().parse(stream)
-        person = Person.objects.get(pk=data['id'])
+        data = parse_body(request)
+        person = get_person(data['id'])
 
         serializer = PersonSerializer(person, data=data, partial=True)
         serializer.is_valid()
         validated_data = serializer.validated_data
         person = serializer.update(person, validated_data)
 
-        return JsonResponse(model_to_dict(person))
+        return render(request, model_to_dict(person))
+
+    elif request.method == 'DELETE':
+        try:
+            filters = get_delete_filters(request)
+        except ValueError:
+            return render(request, {"error": "Age filters must be integers"},
+                          status=400)
+        if not filters:
+            return render(request, {"error": "Bulk delete needs at least one "
+                                             "filter"}, status=400)
+
+        deleted = deletion.delete_people_matching(**filters)
+
+        return render(request, {"deleted": deleted})
 
 
-@require_http_methods(['GET', 'PUT'])
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+@csrf_exempt
 def person_detail(request, person_id):
     if request.method == 'GET':
-        try:
-            person = Person.objects.get(pk=person_id)
-        except Person.DoesNotExist:
+        person_dict = detail_flight.do(('person', person_id),
+                                       lambda: load_person(person_id))
+        if person_dict is None:
             raise Http404("Person does not exist")
 
-        person_dict = model_to_dict(person)
-        person_dict['pets'] = [model_to_dict(pet) for pet in person.get_pets()]
-
-        return JsonResponse({"person": person_dict})
+        return render(request, {"person": person_dict})
 
     elif request.method == 'PUT':
-        stream = io.BytesIO(request.body)
-        data = JSONParser().parse(stream)
-        person = Person.objects.get(pk=person_id)
+        data = parse_body(request)
+        person = get_person(person_id)
 
         serializer = PersonSerializer(person, data=data, partial=True)
         serializer.is_valid()
         validated_data = serializer.validated_data
         person = serializer.update(person, validated_data)
 
-        return JsonResponse(model_to_dict(person))
+        return render(request, model_to_dict(person))
+
+    elif request.method == 'DELETE':
+        deleted = deletion.delete_person(person_id)
+        if not deleted['people']:
+            raise Http404("Person does not exist")
+
+        return render(request, {"deleted": deleted})
+
+
+@require_GET
+def person_pets(request, person_id):
+    try:
+        after, limit = get_page_params(request)
+    except ValueError:
+        return render(request, {"error": "'after' and 'limit' must "
+                                         "be integers"}, status=400)
+    limit = min(limit or PET_PAGE_LIMIT, MAX_PET_PAGE_LIMIT)
+
+    alias = sharding.shard_for_person(person_id)
+    if not Person.objects.using(alias).filter(pk=person_id).exists():
+        raise Http404("Person does not exist")
 
+    pets_list, next_after = load_pets_of(person_id, after, limit)
+    next_url = None
+    if next_after is not None:
+        next_url = f"/people/{person_id}/pets/?after={next_after}" \
+                   f"&limit={limit}"
 
-@require_http_methods(['GET', 'POST', 'PUT'])
+    return render(request, {"pets": pets_list, "next": next_url})
+
+
+@require_http_methods(['GET', 'HEAD', 'POST', 'PUT'])
 @csrf_exempt
+@idempotent
 def pets(request):
-    if request.method == 'GET':
-        pets_query = Pet.objects.all()
-        pets_list = []
-        for pet in pets_query:
-            pet_dict = model_to_dict(pet)
-            pet_dict['owner'] = model_to_dict(pet.owner)
-            pets_list.append(pet_dict)
+    if request.method == 'HEAD':
+        return with_total_count(request, HttpResponse(), Pet)
+
+    elif request.method == 'GET':
+        try:
+            after, limit = get_page_params(request)
+        except ValueError:
+            return render(request, {"error": "'after' and 'limit' must "
+                                             "be integers"}, status=400)
 
-        return JsonResponse({"pets": pets_list})
+        pages = sharding.scatter(
+            lambda alias: load_pets_page(alias, after, limit))
+
+        response = render(request, {"pets": merge_pages(pages, limit)})
+
+        return with_total_count(request, response, Pet)
 
     elif request.method == 'POST':
-        stream = io.BytesIO(request.body)
-        data = JSONParser().parse(stream)
+        data = parse_body(request)
 
         serializer = PetSerializer(data=data)
         serializer.is_valid(raise_exception=True)
         pet = serializer.save()
+        detail_flight.forget(('pet', pet.id))
         pet_dict = model_to_dict(pet)
         pet_dict['owner'] = model_to_dict(pet.owner)
 
-        return JsonResponse(pet_dict)
+        return render(request, pet_dict)
 
     elif request.method == 'PUT':
-        stream = io.BytesIO(request.body)
-        data = JSONParser().parse(stream)
-        pet = Pet.objects.get(pk=data['id'])
+        data = parse_body(request)
+        pet = get_pet(data['id'])
 
         serializer = PetSerializer(pet, data=data, partial=True)
         serializer.is_valid()
@@ -116,26 +327,23 @@ def pets(request):
         pet_dict = model_to_dict(pet)
         pet_dict['owner'] = model_to_dict(pet.owner)
 
-        return JsonResponse(pet_dict)
+        return render(request, pet_dict)
 
 
-@require_http_methods(['GET', 'PUT'])
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+@csrf_exempt
 def pet_detail(request, pet_id):
     if request.method == 'GET':
-        try:
-            pet = Pet.objects.get(pk=pet_id)
-        except Pet.DoesNotExist:
+        pet_dict = detail_flight.do(('pet', pet_id),
+                                    lambda: load_pet(pet_id))
+        if pet_dict is None:
             raise Http404("Pet does not exist")
 
-        pet_dict = model_to_dict(pet)
-        pet_dict['owner'] = model_to_dict(pet.owner)
-
-        return JsonResponse({"pet": pet_dict})
+        return render(request, {"pet": pet_dict})
 
     elif request.method == 'PUT':
-        stream = io.BytesIO(request.body)
-        data = JSONParser().parse(stream)
-        pet = Pet.objects.get(pk=pet_id)
+        data = parse_body(request)
+        pet = get_pet(pet_id)
 
         serializer = PetSerializer(pet, data=data, partial=True)
         serializer.is_valid()
@@ -144,4 +352,11 @@ def pet_detail(request, pet_id):
         pet_dict = model_to_dict(pet)
         pet_dict['owner'] = model_to_dict(pet.owner)
 
-        return JsonResponse(pet_dict)
+        return render(request, pet_dict)
+
+    elif request.method == 'DELETE':
+        deleted = deletion.delete_pet(pet_id)
+        if not deleted['pets']:
+            raise Http404("Pet does not exist")
+
+        return render(request, {"deleted": deleted})
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -94,6 +95,56 @@ DATABASES = {
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Counts and idempotency keys live here. The local-memory cache is per
+# process; point this at Memcached when running several workers so retries
+# are deduplicated across them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+# Person rows and their pets are hashed by person id onto API_SHARDS; id
+# sequences, search data and the bucket map live on API_CATALOG_DATABASE.
+API_SHARDS = ['default']
+
+API_CATALOG_DATABASE = 'default'
+
+DATABASE_ROUTERS = ['api.routers.ShardRouter']
+
+# Responses smaller than this many bytes are sent uncompressed.
+API_COMPRESSION_MIN_SIZE = 1024
+
+# X-Total-Count is exact below API_EXACT_COUNT_THRESHOLD rows, the table
+# statistics estimate from API_ESTIMATED_COUNT_THRESHOLD rows up, and an
+# exact count cached for API_COUNT_CACHE_TTL seconds in between.
+#
+# On MySQL the estimate comes from mysql.innodb_table_stats.n_rows, which
+# InnoDB refreshes after about 10% of a table changes. Without SELECT on the
+# mysql schema it falls back to information_schema.TABLES with
+# information_schema_stats_expiry set to 0 for the session, because the
+# default expiry of 86400 would pick the strategy from a day-old row count.
+API_EXACT_COUNT_THRESHOLD = 10000
+
+API_ESTIMATED_COUNT_THRESHOLD = 1000000
+
+API_COUNT_CACHE_TTL = 30
+
+# POST responses are replayed for repeated Idempotency-Key headers for this
+# many seconds from the API_IDEMPOTENCY_CACHE cache. Duplicates wait up to
+# API_IDEMPOTENCY_LOCK_TIMEOUT seconds for a request still in flight.
+API_IDEMPOTENCY_CACHE = 'default'
+
+API_IDEMPOTENCY_TTL = 24 * 60 * 60
+
+API_IDEMPOTENCY_LOCK_TIMEOUT = 30
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -0,0 +1,28 @@
+"""
+Settings for running the API against several local SQLite shards.
+
+    python manage.py migrate --settings=apitemplate.settings_sharded
+    python manage.py migrate --database=shard_1 --settings=apitemplate.settings_sharded
+    python manage.py migrate --database=shard_2 --settings=apitemplate.settings_sharded
+    python manage.py test api.tests.ShardingTests --settings=apitemplate.settings_sharded
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'shard_0.sqlite3',
+    },
+    'shard_1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'shard_1.sqlite3',
+    },
+    'shard_2': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'shard_2.sqlite3',
+    },
+}
+
+API_SHARDS = ['default', 'shard_1', 'shard_2']